@@ -0,0 +1,34 @@
+# Shared duration statistics for the audio analysis scripts, so future
+# speedups to the scan path land in one place instead of being copied
+# between find_longest_audio.py and find_audio_dist.py.
+
+import numpy as np
+
+from mp3_utils import cached_durations
+
+
+def durations(paths, db_path="audio_index.db", desc="Reading durations"):
+    """
+    Return a float32 array of durations in seconds aligned with `paths`;
+    entries for unreadable files are NaN. Backed by the frame-header reader,
+    the thread pool and the sqlite index, so repeat runs only open files
+    that are new or changed.
+    """
+    paths = list(paths)
+    raw = cached_durations(paths, db_path=db_path, desc=desc)
+    out = np.full(len(paths), np.nan, dtype=np.float32)
+    for i, duration in enumerate(raw):
+        if duration is not None:
+            out[i] = duration
+    return out
+
+
+def longest(paths, db_path="audio_index.db"):
+    """Return (path, duration) of the longest readable clip, or (None, 0.0)
+    if nothing could be read."""
+    paths = list(paths)
+    durs = durations(paths, db_path=db_path, desc="Processing audio files")
+    if len(paths) == 0 or bool(np.all(np.isnan(durs))):
+        return None, 0.0
+    i = int(np.nanargmax(durs))
+    return paths[i], float(durs[i])
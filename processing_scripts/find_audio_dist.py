@@ -1,34 +1,25 @@
 import os
-from mutagen.mp3 import MP3
 import matplotlib.pyplot as plt
 import numpy as np
-from tqdm import tqdm
+
+from audio_stats import durations
+from mp3_utils import iter_mp3
 
 def analyze_audio_lengths(directory):
-    lengths = []
-    # Prepare a list of all MP3 files
-    mp3_files = [
-        os.path.join(root, file)
-        for root, dirs, files in os.walk(directory)
-        for file in files if file.endswith(".mp3")
-    ]
-
-    # Use tqdm to wrap around the loop for a progress bar
-    for file_path in tqdm(mp3_files, desc="Analyzing audio files"):
-        try:
-            # Load the audio file metadata
-            audio = MP3(file_path)
-            # Append the length of the audio file in seconds
-            lengths.append(audio.info.length)
-        except Exception as e:
-            print(f"Error processing file {file_path}: {e}")
-    
-    return lengths
-
-def plot_length_distribution(lengths):
-    # Filter lengths to include only those less than 150 seconds
-    filtered_lengths = [length for length in lengths if length <= 150]
-    
+    # Prepare a list of all MP3 files via scandir, avoiding os.walk's
+    # per-entry stat calls
+    mp3_files = list(iter_mp3(directory))
+
+    # Durations come from the shared scan path (frame headers, thread pool,
+    # sqlite index); unreadable files are NaN and dropped with one mask
+    lengths = durations(
+        mp3_files,
+        db_path=os.path.join(directory, "audio_index.db"),
+        desc="Analyzing audio files",
+    )
+    return lengths[~np.isnan(lengths)]
+
+def plot_length_distribution(filtered_lengths):
     # Plot the distribution of audio lengths
     plt.figure(figsize=(10, 6))
     plt.hist(filtered_lengths, bins=100, color="blue", alpha=0.7, edgecolor="black")
@@ -38,22 +29,23 @@ def plot_length_distribution(lengths):
     plt.grid(True)
     plt.show()
 
-def print_percentiles(lengths):
-    # Filter lengths to include only those less than 150 seconds
-    filtered_lengths = [length for length in lengths if length <= 150]
-    
-    # Print selected percentiles to understand the distribution
+def print_percentiles(filtered_lengths):
+    # Print selected percentiles to understand the distribution; one
+    # np.percentile call means one sort instead of one per percentile
     percentiles = [50, 75, 85, 90, 95]
-    for p in percentiles:
-        value = np.percentile(filtered_lengths, p)
+    values = np.percentile(filtered_lengths, percentiles)
+    for p, value in zip(percentiles, values):
         print(f"{p}th percentile: {value:.2f} seconds")
 
 # Set your directory path here
 directory_path = r"C:\Users\jonec\Documents\SUTD\T6\AI\Voice dataset\cv-corpus-4\clips"
 lengths = analyze_audio_lengths(directory_path)
 
-# Filter and plot the distribution of lengths for clips <= 150s
-plot_length_distribution(lengths)
+# Filter once with a boolean mask; the plot and percentiles share the result
+filtered_lengths = lengths[lengths <= 150]
+
+# Plot the distribution of lengths for clips <= 150s
+plot_length_distribution(filtered_lengths)
 
 # Print percentiles for clips <= 150s
-print_percentiles(lengths)
+print_percentiles(filtered_lengths)
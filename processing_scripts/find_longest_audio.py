@@ -1,31 +1,18 @@
 import os
-from mutagen.mp3 import MP3
-from tqdm import tqdm
 
-def find_longest_audio(directory):
-    longest_duration = 0
-    longest_file = None
+from audio_stats import longest
+from mp3_utils import iter_mp3
 
-    # Prepare a list of all MP3 files
-    mp3_files = [
-        os.path.join(root, file)
-        for root, dirs, files in os.walk(directory)
-        for file in files if file.endswith(".mp3")
-    ]
+def find_longest_audio(directory):
+    # Prepare a list of all MP3 files via scandir, avoiding os.walk's
+    # per-entry stat calls
+    mp3_files = list(iter_mp3(directory))
 
-    # Iterate through all MP3 files with a progress bar
-    for file_path in tqdm(mp3_files, desc="Processing audio files"):
-        try:
-            # Load the audio file metadata
-            audio = MP3(file_path)
-            # Check if this file is the longest so far
-            if audio.info.length > longest_duration:
-                longest_duration = audio.info.length
-                longest_file = file_path
-                # Log the update of the longest file
-                print(f"New longest file: {file_path} with duration: {audio.info.length} seconds")
-        except Exception as e:
-            print(f"Error processing file {file_path}: {e}")
+    # Durations come from the shared scan path (frame headers, thread pool,
+    # sqlite index), so re-runs only open files that are new or changed
+    longest_file, longest_duration = longest(
+        mp3_files, db_path=os.path.join(directory, "audio_index.db")
+    )
 
     # Convert seconds to minutes and seconds for easier reading
     longest_duration_mins = divmod(longest_duration, 60)
@@ -0,0 +1,175 @@
+# Lightweight MP3 duration reading shared by the audio analysis scripts.
+# Instead of letting mutagen parse ID3 tags and walk frames for every clip,
+# we read only the first frame header plus the Xing/Info/VBRI tag, which is
+# enough to compute the duration of a well-formed MP3.
+
+import os
+import sqlite3
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from tqdm import tqdm
+
+# Bitrate tables in kbps, indexed by the 4-bit bitrate index of the frame
+# header. Only Layer III is handled since Common Voice clips are plain MP3s.
+_BITRATES_V1 = [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320]
+_BITRATES_V2 = [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]
+
+# Sampling rates in Hz indexed by the 2-bit sampling rate index, per version.
+_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG 1
+    2: [22050, 24000, 16000],  # MPEG 2
+    0: [11025, 12000, 8000],  # MPEG 2.5
+}
+
+
+def iter_mp3(top):
+    """
+    Yield paths of all .mp3 files under `top`, recursively. Uses os.scandir
+    so is_dir() comes from the cached readdir attributes instead of an extra
+    stat() per entry, unlike os.walk.
+    """
+    stack = [top]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(".mp3"):
+                    yield entry.path
+
+
+def _id3v2_size(header):
+    # ID3v2 header: "ID3", version (2 bytes), flags, then a 4-byte syncsafe
+    # size (7 bits per byte) describing the tag body length.
+    if header[:3] != b"ID3":
+        return 0
+    size = (
+        (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+    )
+    return 10 + size
+
+
+def mp3_duration(path):
+    """
+    Return the duration of an MP3 file in seconds by reading only the first
+    frame header and its Xing/Info/VBRI tag, falling back to a CBR estimate
+    from the file size and bitrate. Raises ValueError if no valid MPEG frame
+    header can be found near the start of the file.
+    """
+    file_size = os.path.getsize(path)
+    with open(path, "rb", buffering=0) as f:
+        head = f.read(10)
+        if len(head) < 10:
+            raise ValueError("file too short to be an MP3")
+        audio_start = _id3v2_size(head)
+        f.seek(audio_start)
+        # A few KB is enough to cover the frame header, side info and the
+        # Xing/VBRI tag, plus some slack to resynchronise on odd files.
+        buf = f.read(4096)
+
+    # Locate the frame sync: 11 set bits across two bytes.
+    pos = 0
+    while True:
+        pos = buf.find(b"\xff", pos)
+        if pos < 0 or pos + 4 > len(buf):
+            raise ValueError("no MPEG frame sync found")
+        if buf[pos + 1] & 0xE0 == 0xE0:
+            b1, b2 = buf[pos + 1], buf[pos + 2]
+            version = (b1 >> 3) & 3
+            layer = (b1 >> 1) & 3
+            bitrate_index = b2 >> 4
+            sr_index = (b2 >> 2) & 3
+            if (
+                version != 1  # reserved
+                and layer == 1  # Layer III
+                and bitrate_index not in (0, 15)
+                and sr_index != 3
+            ):
+                break
+        pos += 1
+
+    sample_rate = _SAMPLE_RATES[version][sr_index]
+    samples_per_frame = 1152 if version == 3 else 576
+    channel_mode = (buf[pos + 3] >> 6) & 3
+
+    # Offset of the Xing/Info tag from the frame header: 4 header bytes plus
+    # the side info block, whose size depends on version and channel count.
+    if version == 3:
+        xing_offset = pos + (21 if channel_mode == 3 else 36)
+    else:
+        xing_offset = pos + (13 if channel_mode == 3 else 21)
+
+    tag = buf[xing_offset : xing_offset + 12]
+    if tag[:4] in (b"Xing", b"Info") and len(tag) >= 12:
+        flags = struct.unpack(">I", tag[4:8])[0]
+        if flags & 1:  # frame count present
+            frames = struct.unpack(">I", tag[8:12])[0]
+            return frames * samples_per_frame / sample_rate
+
+    # VBRI tags (Fraunhofer encoder) sit at a fixed 32-byte offset after the
+    # frame header; the frame count is 14 bytes into the tag.
+    vbri = buf[pos + 36 : pos + 36 + 18]
+    if vbri[:4] == b"VBRI" and len(vbri) >= 18:
+        frames = struct.unpack(">I", vbri[14:18])[0]
+        return frames * samples_per_frame / sample_rate
+
+    # No VBR tag: assume CBR and estimate from the bitrate in the header.
+    bitrates = _BITRATES_V1 if version == 3 else _BITRATES_V2
+    bitrate = bitrates[bitrate_index] * 1000
+    return (file_size - audio_start) * 8 / bitrate
+
+
+def _duration_or_none(file_path):
+    try:
+        return mp3_duration(file_path)
+    except Exception as e:
+        print(f"Error processing file {file_path}: {e}")
+        return None
+
+
+def cached_durations(paths, db_path="audio_index.db", desc="Reading durations"):
+    """
+    Return a list of durations aligned with `paths` (None where a file could
+    not be read). Durations are cached in a sqlite index keyed by
+    (mtime, size), so re-runs only open files that are new or have changed;
+    the rest come straight from the index.
+    """
+    con = sqlite3.connect(db_path)
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS durations "
+        "(path TEXT PRIMARY KEY, mtime REAL, size INTEGER, duration REAL)"
+    )
+
+    durations = [None] * len(paths)
+    missing = []  # (index, path, stat result) for files not in the index
+    for i, path in enumerate(paths):
+        st = os.stat(path)
+        row = con.execute(
+            "SELECT mtime, size, duration FROM durations WHERE path = ?", (path,)
+        ).fetchone()
+        if row is not None and row[0] == st.st_mtime and row[1] == st.st_size:
+            durations[i] = row[2]
+        else:
+            missing.append((i, path, st))
+
+    if missing:
+        # Header reads are I/O-bound, so scan the uncached files on a
+        # thread pool and stream results back in order
+        max_workers = min(64, (os.cpu_count() or 4) * 8)
+        new_rows = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(_duration_or_none, [m[1] for m in missing])
+            for (i, path, st), duration in tqdm(
+                zip(missing, results), total=len(missing), desc=desc
+            ):
+                if duration is not None:
+                    durations[i] = duration
+                    new_rows.append((path, st.st_mtime, st.st_size, duration))
+        con.executemany(
+            "INSERT OR REPLACE INTO durations VALUES (?, ?, ?, ?)", new_rows
+        )
+        con.commit()
+
+    con.close()
+    return durations
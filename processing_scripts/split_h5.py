@@ -5,11 +5,33 @@ import os
 from tqdm import tqdm
 import numpy as np
 
+# A big chunk cache keeps repeatedly-touched chunks in memory while we walk
+# thousands of small groups; the default 1 MB per dataset thrashes. The slot
+# count is prime, roughly 10x the chunks that fit in cache per h5py docs.
+H5_CACHE_OPTS = dict(
+    rdcc_nbytes=256 * 1024 * 1024, rdcc_nslots=1_000_003, rdcc_w0=0.75
+)
+
+def copy_group_buffered(original_hdf5, part_hdf5, key, buffers):
+    # Manual fallback when the native copy cannot be used: read_direct into
+    # reusable per-(shape, dtype) buffers so each dataset does not allocate
+    # a fresh array on the way through Python
+    dest_grp = part_hdf5.create_group(key)
+    for dataset_name, src_ds in original_hdf5[key].items():
+        buf_key = (src_ds.shape, src_ds.dtype.str)
+        buf = buffers.get(buf_key)
+        if buf is None:
+            buf = np.empty(src_ds.shape, dtype=src_ds.dtype)
+            buffers[buf_key] = buf
+        src_ds.read_direct(buf)
+        dest_grp.create_dataset(dataset_name, data=buf)
+
 def split_hdf5_file(original_hdf5_path, parts=10):
-    with h5py.File(original_hdf5_path, 'r') as original_hdf5:
+    with h5py.File(original_hdf5_path, 'r', **H5_CACHE_OPTS) as original_hdf5:
         keys = list(original_hdf5.keys())
         total_keys = len(keys)
         keys_per_part = np.ceil(total_keys / parts).astype(int)
+        buffers = {}  # Reused across parts by copy_group_buffered
 
         for part in range(parts):
             start_index = part * keys_per_part
@@ -17,13 +39,16 @@ def split_hdf5_file(original_hdf5_path, parts=10):
             part_keys = keys[start_index:end_index]
 
             part_file_name = f"{os.path.splitext(original_hdf5_path)[0]}_{part + 1}.h5"
-            with h5py.File(part_file_name, 'w') as part_hdf5:
+            with h5py.File(part_file_name, 'w', **H5_CACHE_OPTS) as part_hdf5:
                 for key in tqdm(part_keys, desc=f"Writing {part_file_name}"):
-                    grp = original_hdf5[key]
-                    dest_grp = part_hdf5.create_group(key)
-                    for dataset_name in grp.keys():
-                        data = grp[dataset_name][()]
-                        dest_grp.create_dataset(dataset_name, data=data)
+                    try:
+                        # Copy the group natively (H5Ocopy) so chunks move
+                        # without being materialised into NumPy arrays and
+                        # recompressed
+                        original_hdf5.copy(key, part_hdf5)
+                    except Exception as e:
+                        print(f"Native copy failed for {key}: {e}")
+                        copy_group_buffered(original_hdf5, part_hdf5, key, buffers)
             print(f"Part {part + 1} saved as {part_file_name}")
 
 if __name__ == "__main__":